@@ -8,6 +8,9 @@
 # run with:
 # python start_jupyter_kernel.py
 #
+# or, to only (re)build the image ahead of time without starting a sandbox:
+# python start_jupyter_kernel.py --build-only
+#
 # then see sandbox dashboard:
 # https://modal.com/sandboxes/personalizedmodels/main
 #
@@ -29,13 +32,21 @@ MEM = 2048 # for training you need more (16384 is a good default)
 ###########################
 
 
-import json
+import argparse
+import asyncio
+import os
 import secrets
+import tempfile
 import time
-import urllib.request
+from pathlib import Path
 
+import aiohttp
 import modal
 
+parser = argparse.ArgumentParser(description="Start a jupyter kernel on Modal as a sandbox")
+parser.add_argument("--build-only", action="store_true", help="only build the image, don't start a sandbox")
+args = parser.parse_args()
+
 STORAGE_VOLUME_NAME = "jupyter_kernel"
 
 app = modal.App.lookup(STORAGE_VOLUME_NAME, create_if_missing=True)
@@ -43,94 +54,160 @@ app = modal.App.lookup(STORAGE_VOLUME_NAME, create_if_missing=True)
 volume = modal.Volume.from_name(STORAGE_VOLUME_NAME, create_if_missing=True)
 
 
+# uv resolves and downloads in parallel, which is much faster than pip for the large CUDA wheels.
+# --no-cache: Modal's image builder has no BuildKit-style cache mounts, so a wheel cache would
+# only end up in (and bloat) the layer -- unchanged layers are reused from Modal's image cache instead
+UV_OPTIONS = "--no-cache"
+
+
+# The pytorch base image already ships python, torch, torchaudio and the CUDA/cuDNN
+# libraries in one prebuilt image, so there is no separate python or torch layer to add.
 image = (
-    modal.Image.from_registry("nvidia/cuda:12.3.2-cudnn9-runtime-ubuntu22.04", add_python="3.11")
+    modal.Image.from_registry("pytorch/pytorch:2.4.0-cuda12.1-cudnn9-runtime")
+    # runtime libraries only -- everything below installs from prebuilt wheels, so no compiler/dev headers needed
     .apt_install(
-        "wget",
-        "git",
-        "libsndfile1",
-        "libsndfile1-dev",
         "ffmpeg",
-        "pkg-config",
-	"build-essential",)
-    .pip_install(
-	"accelerate>=0.26.0",
-        "jupyter~=1.1.0",
-        "numpy",
-	"itables",
+        "libsndfile1",
+        "git",
+    )
+    # Split into layers ordered from stable to volatile, so bumping e.g. the transformers
+    # pin only rebuilds the last layer and the layers below stay cached.
+    .uv_pip_install("ctranslate2", extra_options=UV_OPTIONS)
+    # ctranslate2 (used by faster_whisper) needs the cuBLAS/cuDNN libraries that came with
+    # torch, but does not look for them inside the python environment -- link them onto
+    # the default library path. find succeeds even if it matches nothing, so check the links
+    # exist -- a base image with a different layout fails the build instead of the notebook.
+    .run_commands(
+        "find /opt/conda/lib \\( -name 'libcublas*.so.12' -o -name 'libcudnn*.so.9' \\)"
+        " -exec ln -sf {} /usr/local/lib/ \\; && ldconfig"
+        " && ls /usr/local/lib/libcublas.so.12 /usr/local/lib/libcudnn_ops.so.9"
+    )
+    .uv_pip_install(
         "librosa",
         "soundfile",
         "audioread",
-        "datasets[audio]==3.6.0", # use 3.6.0 as latest version (4.0.0) has breaking changes
+        "numpy",
+        extra_options=UV_OPTIONS,
+    )
+    .uv_pip_install(
+        "jupyter~=1.1.0",
+        "itables",
         "matplotlib",
-        "evaluate",
-	"jiwer",
-        "huggingface_hub",
-        "torch",
-        "torchaudio",
-        "ctranslate2",
-        "faster_whisper",
+        "tensorboard",
+        extra_options=UV_OPTIONS,
+    )
+    .uv_pip_install(
         "transformers==4.52.0", # to avoid some issues with the latest version as discussed here: https://huggingface.co/openai/whisper-large-v3/discussions/201
-	"tensorboard"
+        "faster_whisper",
+        "datasets[audio]==3.6.0", # use 3.6.0 as latest version (4.0.0) has breaking changes
+        "huggingface_hub",
+        "evaluate",
+        "jiwer",
+        "accelerate>=0.26.0",
+        extra_options=UV_OPTIONS,
     )
 )
 
 
-token = secrets.token_urlsafe(13)
-token_secret = modal.Secret.from_dict({"JUPYTER_TOKEN": token})
-
-
+# Reuse the token across runs, so the notebook URL (and any kernel connection configured
+# with it) stays the same. Delete the file to get a new token.
+TOKEN_PATH = Path.home() / ".config" / "modal_tooling" / f"{STORAGE_VOLUME_NAME}.token"
 
 
-
-print("🏖️  Creating sandbox")
-
-with modal.enable_output():
-    sandbox = modal.Sandbox.create(
-        "jupyter",
-        "notebook",
-        "--no-browser",
-        "--allow-root",
-        "--ip=0.0.0.0",
-        f"--port={JUPYTER_PORT}",
-        "--NotebookApp.allow_origin='*'",
-        "--NotebookApp.allow_remote_access=1",
-        encrypted_ports=[JUPYTER_PORT],
-        secrets=[token_secret],
-        timeout=TIMEOUT,
-        image=image,
-        app=app,
-        gpu=GPU_TYPE, 
-        cpu=NUM_CPUS,
-        memory=MEM,
-        volumes={f"/{STORAGE_VOLUME_NAME}": volume}
-    )
-
-print(f"🏖️  Sandbox ID: {sandbox.object_id}")
-
-tunnel = sandbox.tunnels()[JUPYTER_PORT]
-url = f"{tunnel.url}/?token={token}"
-print(f"🏖️  Jupyter notebook is running at: {url}")
-
-
-def is_jupyter_up():
+def load_token():
+    TOKEN_PATH.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+    token = ""
+    try:
+        stat = TOKEN_PATH.stat()
+        # only trust a token file that nobody else could have written or read
+        if stat.st_uid == os.getuid() and stat.st_mode & 0o077 == 0:
+            token = TOKEN_PATH.read_text().strip()
+    except FileNotFoundError:
+        pass
+    if not token:
+        # an empty JUPYTER_TOKEN would disable authentication, so only ever reuse a non-empty token
+        token = secrets.token_urlsafe(32)
+        # write to a temp file (only readable by the current user) and swap it in, so an
+        # interrupted run can't leave a half-written token behind
+        fd, tmp_path = tempfile.mkstemp(dir=TOKEN_PATH.parent, prefix=f".{TOKEN_PATH.name}.")
+        with os.fdopen(fd, "w") as f:
+            f.write(token)
+        os.replace(tmp_path, TOKEN_PATH)
+    return token
+
+
+async def is_jupyter_up(session, tunnel, token):
     try:
-        response = urllib.request.urlopen(f"{tunnel.url}/api/status?token={token}")
-        if response.getcode() == 200:
-            data = json.loads(response.read().decode())
-            return data.get("started", False)
+        async with session.get(f"{tunnel.url}/api/status", params={"token": token}) as response:
+            if response.status == 200:
+                data = await response.json()
+                return data.get("started", False)
     except Exception:
         return False
     return False
 
 
-# timeout for startup
-startup_timeout = 60  # seconds
-start_time = time.time()
-while time.time() - start_time < startup_timeout:
-    if is_jupyter_up():
-        print("🏖️  Jupyter is up and running!")
-        break
-    time.sleep(1)
-else:
-    print("🏖️  Timed out waiting for Jupyter to start.")    
+async def main():
+    # Build the image up front (a no-op if it is already cached), so Sandbox.create can go
+    # straight to launching the container.
+    print("🏖️  Building image")
+
+    with modal.enable_output():
+        await image.build.aio(app)
+
+    if args.build_only:
+        print(f"🏖️  Image ID: {image.object_id}")
+        return
+
+    token = load_token()
+    token_secret = modal.Secret.from_dict({"JUPYTER_TOKEN": token})
+
+    print("🏖️  Creating sandbox")
+
+    # The HTTP client for the status checks -- its connection pool keeps the connection
+    # alive across polls
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=2)) as session:
+        with modal.enable_output():
+            sandbox = await modal.Sandbox.create.aio(
+                "jupyter",
+                "notebook",
+                "--no-browser",
+                "--allow-root",
+                "--ip=0.0.0.0",
+                f"--port={JUPYTER_PORT}",
+                "--NotebookApp.allow_origin='*'",
+                "--NotebookApp.allow_remote_access=1",
+                encrypted_ports=[JUPYTER_PORT],
+                secrets=[token_secret],
+                timeout=TIMEOUT,
+                image=image,
+                app=app,
+                gpu=GPU_TYPE,
+                cpu=NUM_CPUS,
+                memory=MEM,
+                volumes={f"/{STORAGE_VOLUME_NAME}": volume}
+            )
+
+        print(f"🏖️  Sandbox ID: {sandbox.object_id}")
+
+        tunnel = (await sandbox.tunnels.aio())[JUPYTER_PORT]
+        url = f"{tunnel.url}/?token={token}"
+        print(f"🏖️  Jupyter notebook is running at: {url}")
+
+        # timeout for startup
+        startup_timeout = 60  # seconds
+        # poll quickly at first (jupyter is often up within a fraction of a second), then back off
+        poll_interval = 0.1  # seconds
+        max_poll_interval = 1.0  # seconds
+        start_time = time.time()
+        while time.time() - start_time < startup_timeout:
+            if await is_jupyter_up(session, tunnel, token):
+                print("🏖️  Jupyter is up and running!")
+                break
+            await asyncio.sleep(poll_interval)
+            poll_interval = min(poll_interval * 1.5, max_poll_interval)
+        else:
+            print("🏖️  Timed out waiting for Jupyter to start.")
+
+
+asyncio.run(main())
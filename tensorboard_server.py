@@ -30,6 +30,8 @@ URL Parameters:
 Multiple Experiments:
     Start the server ONCE and access different experiments by changing the logdir parameter.
     Each unique logdir creates a separate TensorBoard instance that's cached for performance.
+    Up to MAX_CACHED_EXPERIMENTS instances are kept; beyond that the least recently used one is
+    released and recreated on its next request.
     You can monitor multiple training runs simultaneously in different browser tabs.
 
 Volume Setup:
@@ -37,17 +39,33 @@ Volume Setup:
     Ensure, that you are setting the sam STORAGE_VOLUME_NAME in start_jupyter_kernel.py!
 
 Container Lifecycle:
-    The server automatically stays alive while TensorBoard tabs are open (due to auto-refresh).
-    It shuts down after 10 minutes of no requests (when all tabs are closed, computer sleeps, 
-    or internet disconnects). Cold start takes ~10-30 seconds when accessing after shutdown.
+    One container is kept warm at all times (MIN_CONTAINERS = 1), so opening the dashboard
+    doesn't pay the ~10-30 second cold start. This keeps a small CPU container running (and
+    billed) while the app is deployed -- set MIN_CONTAINERS = 0 to instead shut down after
+    10 minutes of no requests (when all tabs are closed, computer sleeps, or internet disconnects).
 """
 
 import modal
 import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from urllib.parse import parse_qs, unquote
 
 # Configuration constants
 STORAGE_VOLUME_NAME = "jupyter_kernel"
 LOGDIR = f"/{STORAGE_VOLUME_NAME}"
+MIN_CONTAINERS = 1  # keep one container warm to avoid cold starts, 0 to scale down when idle
+# TensorBoard instances kept loaded, the least recently used one is released beyond that. Releasing
+# stops the fast data server; with the python loader (no data server available) the instance's
+# runs are dropped, but its reload thread can't be stopped and keeps idling until the container
+# restarts -- one per evicted experiment.
+MAX_CACHED_EXPERIMENTS = 8
+MAX_CONCURRENT_DATA_REQUESTS = 8  # data API calls parse event files (CPU-bound), static assets are not limited
 
 app = modal.App("tensorboard-server")
 
@@ -61,119 +79,287 @@ tensorboard_image = modal.Image.debian_slim().pip_install([
     "protobuf",
 ])
 
+# Only installed in the image, so these imports are deferred until the container runs
+with tensorboard_image.imports():
+    from tensorboard import default, program
+    from tensorboard.backend.application import TensorBoardWSGIApp
+
+# Directory probing (only for the logs) and releasing evicted TensorBoard instances run in the
+# background, so requests don't wait on the (networked) volume or a data server shutting down
+background_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="tensorboard-background")
+
+# Stops at the first event file instead of listing the whole directory -- experiment dirs
+# can hold thousands of files, and the volume is a networked file system
+def has_event_files(full_logdir):
+    with os.scandir(full_logdir) as entries:
+        return any('tfevents' in entry.name.lower() for entry in entries)
+
+# Log whether an experiment directory has event files (helps debugging empty dashboards)
+def log_logdir_contents(full_logdir):
+    try:
+        if has_event_files(full_logdir):
+            print(f"Event files found in {full_logdir}")
+        else:
+            print(f"No event files directly in {full_logdir} (runs in subdirectories are still picked up)")
+    except FileNotFoundError:
+        print(f"WARNING: Directory {full_logdir} does not exist!")
+    except Exception as e:
+        print(f"Error listing directory {full_logdir}: {e}")
+
+LOGDIR_PATTERN = re.compile(r'logdir=([^&]+)')
+
+# A browser tab sends the same query string/referer with each of its ~30-40 requests,
+# so cache the parsing
+@lru_cache(maxsize=512)
+def logdir_from_query(query_string):
+    logdir_param = parse_qs(query_string).get('logdir', [None])[0]
+    # URL decode the logdir parameter (fixes %2F -> / conversion)
+    if logdir_param:
+        logdir_param = unquote(logdir_param)
+    return logdir_param
+
+@lru_cache(maxsize=512)
+def logdir_from_referer(referer):
+    match = LOGDIR_PATTERN.search(referer)
+    if not match:
+        return None
+    logdir_param = unquote(match.group(1))  # URL decode
+    print(f"Extracted logdir from referer: {logdir_param}")
+    return logdir_param
+
+# Many concurrent event-file reads in one container just contend for the GIL, so cap the
+# data API calls and let static assets through unthrottled
+data_request_slots = threading.Semaphore(MAX_CONCURRENT_DATA_REQUESTS)
+
+# Request kinds, classified once per request by dict lookups on the file extension and the
+# first path segment instead of a chain of prefix/suffix checks
+ROUTE_ASSET = "asset"  # fonts, scripts, styles and images -- these never touch the training logs
+ROUTE_DATA = "data"  # /data/ API calls, which read the event files
+ROUTE_API = "api"  # other calls issued by the page itself (/experiment/)
+ROUTE_PAGE = "page"  # everything else, i.e. the dashboard/landing page
+ROUTE_ENVIRON_KEY = "tensorboard_server.route"
+
+EXTENSION_ROUTES = dict.fromkeys(("js", "css", "woff2", "woff", "svg", "png", "ico"), ROUTE_ASSET)
+SEGMENT_ROUTES = {"data": ROUTE_DATA, "experiment": ROUTE_API}
+
+def classify_path(path_info):
+    # Assets first: e.g. /data/plugin/<name>/index.js is a static file, not a data call
+    route = EXTENSION_ROUTES.get(path_info.rpartition('.')[2])
+    if route:
+        return route
+    if path_info.startswith('/font-'):
+        return ROUTE_ASSET
+    first_segment, slash, _ = path_info[1:].partition('/')
+    if slash:
+        return SEGMENT_ROUTES.get(first_segment, ROUTE_PAGE)
+    return ROUTE_PAGE
+
+# Stop an evicted TensorBoard instance from holding on to its logdir. TensorBoard has no API for
+# this, so it relies on internals (like board._make_data_provider below) and is best-effort:
+# failures are only logged.
+def release_tensorboard(board, logdir_param):
+    try:
+        ingester = board._ingester
+        # The fast data server subprocess exits once its stdin is closed (--die-after-stdin)
+        stdin_handle = getattr(ingester, '_stdin_handle', None)
+        if stdin_handle is not None:
+            # (the exited process is reaped the next time a subprocess is started)
+            stdin_handle.close()
+            return
+        # The python loader reloads in a daemon thread that can't be stopped, so drop its runs
+        # and loaded events to leave it nothing to read. The Reloader may be iterating the run
+        # dict, so swap in an empty one instead of clearing it; a reload that is already
+        # running can still re-add an accumulator.
+        multiplexer = getattr(ingester, 'deprecated_multiplexer', None)
+        if multiplexer is not None:
+            ingester._path_to_run = {}
+            with multiplexer._accumulators_mutex:
+                multiplexer._accumulators.clear()
+                multiplexer._paths.clear()
+    except Exception as e:
+        print(f"Failed to release TensorBoard instance for {logdir_param}: {e}")
+
+class CachedTensorBoard:
+    def __init__(self):
+        self.ready = threading.Event()
+        self.board = None
+        self.wsgi_app = None
+        self.error = None
+        self.active_requests = 0
+        self.evicted = False
+
+# LRU cache of TensorBoard instances, one per logdir. The lock only guards the bookkeeping:
+# instances are created outside of it (a slow first load of one experiment doesn't stall the
+# other dashboards), and an evicted instance is only released once its last request finished.
+class TensorBoardCache:
+    def __init__(self, create, release, max_size):
+        self.create = create  # logdir_param -> (board, wsgi_app)
+        self.release = release  # (board, logdir_param) -> None
+        self.max_size = max_size
+        self._entries = OrderedDict()  # least recently used first
+        self._lock = threading.Lock()
+
+    def most_recent(self):
+        with self._lock:
+            return next(reversed(self._entries), None)
+
+    # Yields the WSGI app for logdir_param, keeping its instance alive while in use. TensorBoard
+    # builds its response bodies before returning, so the request is done when the app returns.
+    @contextmanager
+    def use(self, logdir_param):
+        entry, is_new, evicted = self._acquire(logdir_param)
+        try:
+            for evicted_logdir, evicted_entry in evicted:
+                self._release_entry(evicted_logdir, evicted_entry)
+            if is_new:
+                try:
+                    entry.board, entry.wsgi_app = self.create(logdir_param)
+                except Exception as e:
+                    entry.error = e
+                    with self._lock:
+                        # Forget the failed instance, so the next request tries again
+                        if self._entries.get(logdir_param) is entry:
+                            del self._entries[logdir_param]
+                finally:
+                    entry.ready.set()
+            else:
+                # Another request is creating it -- only this logdir's requests wait for that
+                entry.ready.wait()
+            if entry.error is not None:
+                raise entry.error
+            yield entry.wsgi_app
+        finally:
+            with self._lock:
+                entry.active_requests -= 1
+                release = entry.evicted and entry.active_requests == 0
+            if release:
+                self._release_entry(logdir_param, entry)
+
+    def _acquire(self, logdir_param):
+        with self._lock:
+            entry = self._entries.get(logdir_param)
+            is_new = entry is None
+            if is_new:
+                entry = self._entries[logdir_param] = CachedTensorBoard()
+            else:
+                self._entries.move_to_end(logdir_param)
+            entry.active_requests += 1
+
+            # Entries still in use are released by their last request instead
+            evicted = []
+            while len(self._entries) > self.max_size:
+                evicted_logdir, evicted_entry = self._entries.popitem(last=False)
+                evicted_entry.evicted = True
+                if evicted_entry.active_requests == 0:
+                    evicted.append((evicted_logdir, evicted_entry))
+            return entry, is_new, evicted
+
+    def _release_entry(self, logdir_param, entry):
+        if entry.board is not None:
+            print(f"Releasing TensorBoard instance for logdir: {logdir_param}")
+            self.release(entry.board, logdir_param)
+
 # Middleware to reload volume data on requests
 class VolumeMiddleware:
+    # A single page load fires dozens of requests, so only reload once per interval. reload()
+    # refreshes the whole mount, so the interval is shared by all experiments' middlewares.
+    RELOAD_INTERVAL = 5.0  # seconds
+    _last_reload = 0.0
+    _reload_lock = threading.Lock()
+
     def __init__(self, app, volume, logdir):
         self.app = app
         self.volume = volume
         self.logdir = logdir
 
+    # Claim the next reload slot, so concurrent requests (and failed reloads) don't retry immediately
+    @classmethod
+    def _claim_reload(cls):
+        with cls._reload_lock:
+            now = time.monotonic()
+            if now - cls._last_reload <= cls.RELOAD_INTERVAL:
+                return False
+            cls._last_reload = now
+            return True
+
     def __call__(self, environ, start_response):
-        # Try to reload volume, but don't fail if files are in use
-        try:
-            print(f"Attempting to reload volume for {self.logdir}...")
-            self.volume.reload()
-            print(f"Volume reload successful for {self.logdir}")
-        except RuntimeError as e:
-            if "open files preventing" in str(e):
-                print(f"Volume reload skipped (files in use) for {self.logdir}: {str(e)[:100]}...")
-                pass
-            else:
-                print(f"Volume reload failed with unexpected error for {self.logdir}: {e}")
-                raise
-        except Exception as e:
-            print(f"Volume reload failed for {self.logdir}: {e}")
+        # Static assets don't read any logs, so there is nothing to reload for them
+        route = environ.get(ROUTE_ENVIRON_KEY) or classify_path(environ.get('PATH_INFO', '/'))
+        if route == ROUTE_ASSET:
+            return self.app(environ, start_response)
+
+        if self._claim_reload():
+            # Try to reload volume, but don't fail if files are in use
+            try:
+                self.volume.reload()
+            except RuntimeError as e:
+                if "open files preventing" in str(e):
+                    print(f"Volume reload skipped (files in use) for {self.logdir}: {str(e)[:100]}...")
+                    pass
+                else:
+                    print(f"Volume reload failed with unexpected error for {self.logdir}: {e}")
+                    raise
+            except Exception as e:
+                print(f"Volume reload failed for {self.logdir}: {e}")
         return self.app(environ, start_response)
 
 @app.function(
     image=tensorboard_image,
     volumes={LOGDIR: volume},
     scaledown_window=600,  # 10 minutes
+    min_containers=MIN_CONTAINERS,
     max_containers=1,
 )
 @modal.concurrent(max_inputs=100)  # High limit needed: each TensorBoard page load generates ~30-40 HTTP requests (assets + API calls)
 @modal.wsgi_app()
 def tensorboard_app():
-    import tensorboard
-    from urllib.parse import parse_qs
+    # Plugin discovery (incl. scanning entry points) is the same for every experiment, so do it once
+    plugins = default.get_plugins()
     
+    def create_tensorboard(logdir_param):
+        full_logdir = os.path.join(LOGDIR, logdir_param)
+        print(f"Creating new TensorBoard instance for logdir: {full_logdir}")
+        
+        # Check if directory exists and what's in it
+        background_executor.submit(log_logdir_contents, full_logdir)
+
+        board = program.TensorBoard(plugins=plugins)
+        board.configure(logdir=full_logdir)
+        (data_provider, deprecated_multiplexer) = board._make_data_provider()
+        wsgi_app = TensorBoardWSGIApp(
+            board.flags,
+            board.plugin_loaders,
+            data_provider,
+            board.assets_zip_provider,
+            deprecated_multiplexer,
+            experimental_middlewares=[lambda app: VolumeMiddleware(app, volume, logdir_param)],
+        )
+        return board, wsgi_app
+
     # Cache TensorBoard instances
-    tensorboard_cache = {}
-    
-    def get_tensorboard_app(logdir_param):
-        if logdir_param not in tensorboard_cache:
-            full_logdir = os.path.join(LOGDIR, logdir_param)
-            print(f"Creating new TensorBoard instance for logdir: {full_logdir}")
-            
-            # Check if directory exists and what's in it
-            if os.path.exists(full_logdir):
-                try:
-                    files = os.listdir(full_logdir)
-                    print(f"Directory {full_logdir} contains: {files}")
-                    # Find event files
-                    event_files = [f for f in files if 'tfevents' in f.lower()]
-                    print(f"Event files found: {event_files}")
-                except Exception as e:
-                    print(f"Error listing directory {full_logdir}: {e}")
-            else:
-                print(f"WARNING: Directory {full_logdir} does not exist!")
-            
-            board = tensorboard.program.TensorBoard()
-            board.configure(logdir=full_logdir)
-            (data_provider, deprecated_multiplexer) = board._make_data_provider()
-            wsgi_app = tensorboard.backend.application.TensorBoardWSGIApp(
-                board.flags,
-                board.plugin_loaders,
-                data_provider,
-                board.assets_zip_provider,
-                deprecated_multiplexer,
-                experimental_middlewares=[lambda app: VolumeMiddleware(app, volume, logdir_param)],
-            )
-            tensorboard_cache[logdir_param] = wsgi_app
-        return tensorboard_cache[logdir_param]
+    tensorboard_cache = TensorBoardCache(
+        create_tensorboard,
+        lambda board, logdir_param: background_executor.submit(release_tensorboard, board, logdir_param),
+        MAX_CACHED_EXPERIMENTS,
+    )
     
     def create_app(environ, start_response):
         # Parse URL parameters to get logdir
-        query_string = environ.get('QUERY_STRING', '')
-        params = parse_qs(query_string)
-        logdir_param = params.get('logdir', [None])[0]
-        
-        # URL decode the logdir parameter (fixes %2F -> / conversion)
-        if logdir_param:
-            from urllib.parse import unquote
-            logdir_param = unquote(logdir_param)
+        logdir_param = logdir_from_query(environ.get('QUERY_STRING', ''))
         
         # Check if this is an asset or API request (doesn't need logdir in URL)
-        path_info = environ.get('PATH_INFO', '/')
-        is_asset_or_api = (path_info.startswith('/font-') or 
-                          path_info.startswith('/data/') or
-                          path_info.startswith('/experiment/') or
-                          path_info.endswith('.js') or 
-                          path_info.endswith('.css') or 
-                          path_info.endswith('.woff2') or 
-                          path_info.endswith('.woff') or
-                          path_info.endswith('.svg') or
-                          path_info.endswith('.png') or
-                          path_info.endswith('.ico'))
-        
+        route = classify_path(environ.get('PATH_INFO', '/'))
+        environ[ROUTE_ENVIRON_KEY] = route  # reused by VolumeMiddleware
         if not logdir_param:
-            if is_asset_or_api:
+            if route != ROUTE_PAGE:
                 # For assets/API requests, try to get logdir from Referer header
                 referer = environ.get('HTTP_REFERER', '')
                 if 'logdir=' in referer:
-                    import re
-                    from urllib.parse import unquote
-                    match = re.search(r'logdir=([^&]+)', referer)
-                    if match:
-                        logdir_param = unquote(match.group(1))  # URL decode
-                        print(f"Extracted logdir from referer: {logdir_param}")
+                    logdir_param = logdir_from_referer(referer)
                 
-                # Fallback: use the first available TensorBoard or default
+                # Fallback: use the most recently used TensorBoard or default
                 if not logdir_param:
-                    if tensorboard_cache:
-                        logdir_param = list(tensorboard_cache.keys())[0]
-                    else:
-                        logdir_param = "train_test_1"  # Default
+                    logdir_param = tensorboard_cache.most_recent() or "train_test_1"  # Default
             else:
                 # Return simple landing page for root requests without logdir
                 landing_html = """
@@ -190,7 +376,10 @@ def tensorboard_app():
                 return [landing_html.encode()]
         
         # Get or create TensorBoard app for this logdir
-        wsgi_app = get_tensorboard_app(logdir_param)
-        return wsgi_app(environ, start_response)
+        with tensorboard_cache.use(logdir_param) as wsgi_app:
+            if route == ROUTE_DATA:
+                with data_request_slots:
+                    return wsgi_app(environ, start_response)
+            return wsgi_app(environ, start_response)
     
     return create_app
\ No newline at end of file
@@ -0,0 +1,195 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("modal")
+pytest.importorskip("tensorboard")
+
+import tensorboard_server as ts
+
+
+# The prefix/suffix predicates used before the route table
+def reference_is_static_asset(path_info):
+    return path_info.startswith(('/font-',)) or path_info.endswith(
+        ('.js', '.css', '.woff2', '.woff', '.svg', '.png', '.ico'))
+
+def reference_is_asset_or_api(path_info):
+    return reference_is_static_asset(path_info) or path_info.startswith(('/data/', '/experiment/'))
+
+# The data semaphore caps event-file reads and leaves static assets uncapped
+def reference_is_semaphore_gated(path_info):
+    return path_info.startswith('/data/') and not reference_is_static_asset(path_info)
+
+
+@pytest.mark.parametrize("path_info", [
+    "/",
+    "/index.html",
+    "/index.js",
+    "/styles.css",
+    "/favicon.ico",
+    "/icon_bundle.svg",
+    "/font-roboto",
+    "/font-roboto/",
+    "/font-roboto/oMMgfZMQthOryQo9n22dcuvvDin1pK8aKteLpeZ5c0A.woff2",
+    "/data",
+    "/data/",
+    "/data/runs",
+    "/data/environment",
+    "/data/plugins_listing",
+    "/data/plugin/scalars/tags",
+    "/data/plugin/scalars/scalars",
+    "/data/plugin/images/individualImage",
+    "/data/plugin/projector/index.js",
+    "/data/plugin/custom/static/logo.png",
+    "/experiment",
+    "/experiment/",
+    "/experiment/eid/data/runs",
+    "/experiment/eid/index.js",
+    "/experiment/eid/data/plugin/scalars/tags",
+    "/tf-interactive-inference-dashboard/editor.html",
+    "/some.dir/file",
+    "/js",
+])
+def test_classify_path_matches_previous_predicates(path_info):
+    route = ts.classify_path(path_info)
+    assert (route == ts.ROUTE_ASSET) == reference_is_static_asset(path_info)
+    assert (route != ts.ROUTE_PAGE) == reference_is_asset_or_api(path_info)
+    assert (route == ts.ROUTE_DATA) == reference_is_semaphore_gated(path_info)
+
+
+class FakeTensorBoards:
+    def __init__(self):
+        self.created = []
+        self.released = []
+
+    def create(self, logdir_param):
+        self.created.append(logdir_param)
+        return f"board-{logdir_param}", f"app-{logdir_param}"
+
+    def release(self, board, logdir_param):
+        self.released.append(logdir_param)
+
+
+def test_cache_evicts_least_recently_used():
+    fakes = FakeTensorBoards()
+    cache = ts.TensorBoardCache(fakes.create, fakes.release, max_size=2)
+    for logdir_param in ["a", "b", "a", "c"]:
+        with cache.use(logdir_param) as wsgi_app:
+            assert wsgi_app == f"app-{logdir_param}"
+    assert fakes.created == ["a", "b", "c"]
+    assert fakes.released == ["b"]
+    assert cache.most_recent() == "c"
+
+
+def test_cache_releases_evicted_instance_after_its_last_request():
+    fakes = FakeTensorBoards()
+    cache = ts.TensorBoardCache(fakes.create, fakes.release, max_size=1)
+    with cache.use("a"):
+        with cache.use("b"):
+            assert fakes.released == []
+        assert fakes.released == []
+    assert fakes.released == ["a"]
+
+
+def test_cache_creates_instance_once_without_blocking_other_logdirs():
+    fakes = FakeTensorBoards()
+    creating = threading.Event()
+    finish_creating = threading.Event()
+
+    def create(logdir_param):
+        if logdir_param == "slow":
+            creating.set()
+            assert finish_creating.wait(timeout=10)
+        return fakes.create(logdir_param)
+
+    cache = ts.TensorBoardCache(create, fakes.release, max_size=8)
+    with cache.use("fast"):
+        pass
+
+    results = []
+    def request():
+        with cache.use("slow") as wsgi_app:
+            results.append(wsgi_app)
+    threads = [threading.Thread(target=request) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    assert creating.wait(timeout=10)
+
+    # Cached experiments are served while another one is being created
+    with cache.use("fast") as wsgi_app:
+        assert wsgi_app == "app-fast"
+
+    finish_creating.set()
+    for thread in threads:
+        thread.join(timeout=10)
+    assert results == ["app-slow"] * 3
+    assert fakes.created == ["fast", "slow"]
+
+
+def test_cache_retries_failed_creation():
+    calls = []
+
+    def create(logdir_param):
+        calls.append(logdir_param)
+        if len(calls) == 1:
+            raise RuntimeError("boom")
+        return "board", "app"
+
+    cache = ts.TensorBoardCache(create, lambda board, logdir_param: None, max_size=8)
+    with pytest.raises(RuntimeError):
+        with cache.use("a"):
+            pass
+    with cache.use("a") as wsgi_app:
+        assert wsgi_app == "app"
+    assert calls == ["a", "a"]
+
+
+def write_event_file(logdir):
+    from tensorboard.compat.proto import event_pb2, summary_pb2
+    from tensorboard.summary.writer.event_file_writer import EventFileWriter
+
+    writer = EventFileWriter(str(logdir))
+    summary = summary_pb2.Summary(value=[summary_pb2.Summary.Value(tag="loss", simple_value=1.0)])
+    writer.add_event(event_pb2.Event(step=1, wall_time=time.time(), summary=summary))
+    writer.close()
+
+
+def make_board(logdir, **flags):
+    board = ts.program.TensorBoard(plugins=ts.default.get_plugins())
+    board.configure(logdir=str(logdir), **flags)
+    board._make_data_provider()
+    return board
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.05)
+
+
+def test_release_tensorboard_python_loader(tmp_path):
+    write_event_file(tmp_path)
+    board = make_board(tmp_path, load_fast="false", reload_interval=1)
+    multiplexer = board._ingester.deprecated_multiplexer
+    wait_for(lambda: multiplexer.Runs())
+
+    ts.release_tensorboard(board, "test")
+
+    assert board._ingester._path_to_run == {}
+    # the Reloader keeps running, but has nothing left to load
+    time.sleep(1.5)
+    assert multiplexer.Runs() == {}
+
+
+def test_release_tensorboard_data_server(tmp_path):
+    pytest.importorskip("tensorboard_data_server")
+    write_event_file(tmp_path)
+    board = make_board(tmp_path, load_fast="true")
+    stdin_handle = board._ingester._stdin_handle
+
+    ts.release_tensorboard(board, "test")
+
+    # the data server exits once its stdin is closed
+    assert stdin_handle.closed